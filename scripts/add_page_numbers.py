@@ -1,57 +1,141 @@
+import os
 import sys
 import io
-from PyPDF2 import PdfReader, PdfWriter
+import multiprocessing
+from contextlib import ExitStack
+import pikepdf
 from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
 from reportlab.lib.units import inch
 
+# Below this many pages the overlay is drawn in-process; starting a pool
+# of workers costs more than it saves on short documents.
+PARALLEL_PAGE_THRESHOLD = 500
+# Number of pages drawn per worker task
+OVERLAY_CHUNK_SIZE = 128
+
+def _make_overlay_bytes(args):
+    """
+    Draws the page numbers for a run of pages on a single multi-page
+    ReportLab canvas and returns the resulting PDF bytes.
+    Takes (first_page_index, page_sizes) so it can be used with Pool.map.
+    """
+    first_page_index, page_sizes = args
+
+    packet = io.BytesIO()
+    can = canvas.Canvas(packet)
+    margin = 0.5 * inch # Using ReportLab's inch unit
+
+    # Page numbers only contain digits, so look up each digit's width once
+    # instead of measuring every page number string
+    digit_widths = {digit: pdfmetrics.stringWidth(digit, 'Helvetica', 15) for digit in '0123456789'}
+
+    current_size = None
+    for i, (page_width, page_height) in enumerate(page_sizes, start=first_page_index):
+        # Each overlay page matches the size of the original page. The page
+        # size carries over showPage(), so only change it when it differs.
+        if (page_width, page_height) != current_size:
+            current_size = (page_width, page_height)
+            can.setPageSize(current_size)
+
+        # Page number text format (only number)
+        page_number_text = f"{i + 1}"
+
+        # Calculate text width to correctly position it
+        text_width = sum(digit_widths[digit] for digit in page_number_text)
+
+        # Calculate position for top-right corner, with some margin
+        x_position = page_width - text_width - margin
+        y_position = page_height - margin # Position from top
+
+        # Emit the text operators directly through a text object.
+        # Set font to Helvetica (standard and reliable) and size 15; the
+        # graphics state is reset by showPage(), so it is set per page.
+        text = can.beginText(x_position, y_position)
+        text.setFont('Helvetica', 15)
+        text.textOut(page_number_text)
+        can.drawText(text)
+        can.showPage()
+
+    can.save()
+    return packet.getvalue()
+
+def _page_rotation(page):
+    """
+    Returns the page's /Rotate in degrees, normalized to [0, 360), including a
+    value inherited from the page tree.
+    """
+    node, seen = page.obj, set()
+    while node is not None and node.objgen not in seen:
+        if '/Rotate' in node:
+            return int(node.Rotate) % 360
+        seen.add(node.objgen)
+        node = node.get('/Parent')
+    return 0
+
 def add_page_numbers(input_pdf_path, output_pdf_path):
     """
     Adds page numbers to each page of a PDF file.
     The page number will be in the format "N" (only number),
     with font size 15, and positioned at the top right corner.
+    On multi-core machines large documents are drawn in a process pool, so
+    scripts that import this function must guard their entry point with
+    `if __name__ == "__main__":`.
+    Returns True on success and False on failure.
     """
     try:
-        reader = PdfReader(input_pdf_path)
-        writer = PdfWriter()
-
-        for i, page in enumerate(reader.pages):
-            # Create a new PDF with ReportLab for the page number
-            packet = io.BytesIO()
-            # Get the page size from the original PDF
-            page_width = float(page.mediabox.width)
-            page_height = float(page.mediabox.height)
-            can = canvas.Canvas(packet, pagesize=(page_width, page_height))
-            
-            # Set font to Helvetica (standard and reliable) and size 15
-            can.setFont('Helvetica', 15) 
-            
-            # Page number text format (only number)
-            page_number_text = f"{i + 1}"
-            
-            # Calculate text width to correctly position it
-            text_width = can.stringWidth(page_number_text, 'Helvetica', 15) # Use font size 15 here for accurate width
-            
-            # Calculate position for top-right corner, with some margin
-            margin = 0.5 * inch # Using ReportLab's inch unit
-            x_position = page_width - text_width - margin
-            y_position = page_height - margin # Position from top
-
-            can.drawString(x_position, y_position, page_number_text)
-            can.save()
-
-            # Merge the page number PDF with the original page
-            packet.seek(0)
-            number_pdf = PdfReader(packet)
-            page.merge_page(number_pdf.pages[0])
-            writer.add_page(page)
-
-        with open(output_pdf_path, 'wb') as f:
-            writer.write(f)
+        with pikepdf.open(input_pdf_path) as pdf:
+            pages = [pikepdf.Page(page) for page in pdf.pages]
+
+            # Collect the page sizes up front so the page numbers can be drawn
+            # on as few ReportLab canvases as possible and parsed back once.
+            page_sizes = []
+            for page in pages:
+                # Rectangle converts the box to floats once, in QPDF
+                box = pikepdf.Rectangle(page.trimbox)
+                # Draw at the size the page is displayed at; QPDF rotates the
+                # overlay into place, so an unrotated one would be scaled down
+                if _page_rotation(page) in (90, 270):
+                    page_sizes.append((box.height, box.width))
+                else:
+                    page_sizes.append((box.width, box.height))
+
+            # A pool only pays off with more than one core to spread the work across
+            cpu_count = os.cpu_count() or 1
+            if len(page_sizes) >= PARALLEL_PAGE_THRESHOLD and cpu_count > 1:
+                # Large documents: draw the overlay in chunks across all cores
+                chunks = [(start, page_sizes[start:start + OVERLAY_CHUNK_SIZE])
+                          for start in range(0, len(page_sizes), OVERLAY_CHUNK_SIZE)]
+                with multiprocessing.Pool(cpu_count) as pool:
+                    overlays = pool.map(_make_overlay_bytes, chunks)
+            else:
+                overlays = [_make_overlay_bytes((0, page_sizes))]
+
+            # Overlay each page of the number PDFs onto the matching original page
+            with ExitStack() as stack:
+                number_pages = []
+                for overlay in overlays:
+                    number_pdf = stack.enter_context(pikepdf.open(io.BytesIO(overlay)))
+                    number_pages.extend(number_pdf.pages)
+
+                for page, number_page in zip(pages, number_pages):
+                    page.add_overlay(number_page)
+
+                # The overlay streams are copied lazily, so save while they are open.
+                # Existing streams are passed through without being decoded;
+                # object streams and linearization shrink the output and let
+                # viewers show the first page before the download finishes.
+                pdf.save(output_pdf_path,
+                         stream_decode_level=pikepdf.StreamDecodeLevel.none,
+                         object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                         compress_streams=True,
+                         linearize=True)
         print(f"Page numbers added successfully: {output_pdf_path}")
+        return True
 
     except Exception as e:
         print(f"Error adding page numbers: {e}", file=sys.stderr)
-        sys.exit(1)
+        return False
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
@@ -61,5 +145,7 @@ if __name__ == "__main__":
     input_path = sys.argv[1]
     output_path = sys.argv[2]
 
-    add_page_numbers(input_path, output_path)
-
+    if add_page_numbers(input_path, output_path):
+        sys.exit(0)
+    else:
+        sys.exit(1)
@@ -1,21 +1,32 @@
 # scripts/add_watermark.py
 import sys
-import os
+import io
+from contextlib import ExitStack
+from functools import lru_cache
 from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch # Import inch for easier positioning
-from PyPDF2 import PdfReader, PdfWriter # Import PyPDF2 for PDF manipulation
+import pikepdf # pikepdf (QPDF) for PDF manipulation
 
-def create_watermark_pdf(watermark_text, font_size, opacity, rotation, output_wm_pdf):
-    """Creates a temporary PDF with the watermark text using ReportLab."""
-    c = canvas.Canvas(output_wm_pdf, pagesize=letter)
+# Number of rendered watermark PDFs kept in memory. Each entry is a few KB of
+# bytes for one combination of text, styling and page size; the least recently
+# used one is dropped, so long-lived processes do not grow without bound.
+WATERMARK_CACHE_SIZE = 64
+
+# Prefix of the resource names the watermark Form XObjects are registered under.
+# Each page size gets its own name, since pages of different sizes can share
+# one /Resources dictionary.
+WATERMARK_XOBJECT_PREFIX = '/DocSmartWatermark'
+
+def create_watermark_pdf(watermark_text, font_size, opacity, rotation, output_wm_pdf, pagesize):
+    """Creates a PDF with the watermark text using ReportLab."""
+    c = canvas.Canvas(output_wm_pdf, pagesize=pagesize)
     c.setFont("Helvetica", font_size)
     
     # Set fill color with opacity
     c.setFillColorRGB(0, 0, 0, alpha=opacity) 
 
     # Get page dimensions
-    width, height = letter
+    width, height = pagesize
 
     # Position for diagonally centered watermark
     # Move origin to the center of the page
@@ -33,9 +44,32 @@ def create_watermark_pdf(watermark_text, font_size, opacity, rotation, output_wm
 
     c.save()
 
+@lru_cache(maxsize=WATERMARK_CACHE_SIZE)
+def render_watermark_pdf(watermark_text, font_size, opacity, rotation, pagesize):
+    """
+    Returns the watermark rendered as single-page PDF bytes for the given page size.
+    The ReportLab canvas is only drawn once per combination of arguments.
+    """
+    packet = io.BytesIO()
+    create_watermark_pdf(watermark_text, font_size, opacity, rotation, packet, pagesize)
+    return packet.getvalue()
+
+def _page_rotation(page):
+    """
+    Returns the page's /Rotate in degrees, normalized to [0, 360), including a
+    value inherited from the page tree.
+    """
+    node, seen = page.obj, set()
+    while node is not None and node.objgen not in seen:
+        if '/Rotate' in node:
+            return int(node.Rotate) % 360
+        seen.add(node.objgen)
+        node = node.get('/Parent')
+    return 0
+
 def add_watermark_to_pdf(input_pdf_path, output_pdf_path):
     """
-    Adds a hardcoded text watermark to a PDF using PyPDF2.
+    Adds a hardcoded text watermark to a PDF using pikepdf.
     
     Args:
         input_pdf_path (str): Path to the input PDF file.
@@ -47,28 +81,70 @@ def add_watermark_to_pdf(input_pdf_path, output_pdf_path):
     opacity = 0.2
     rotation = 45 # Changed to 45 for diagonal placement
 
-    # Create a temporary PDF for the watermark
-    temp_watermark_pdf_path = f"{os.path.splitext(input_pdf_path)[0]}_temp_watermark_{os.getpid()}.pdf"
     try:
-        create_watermark_pdf(watermark_text, font_size, opacity, rotation, temp_watermark_pdf_path)
+        # Open the original PDF
+        # The ExitStack keeps each watermark PDF open until the output is saved,
+        # since the forms copied from them are only read at that point
+        with pikepdf.open(input_pdf_path) as pdf, ExitStack() as stack:
+            # (Form XObject, resource name) pairs copied into this PDF, keyed by page size.
+            # Every page of a given size references the same object, so the
+            # watermark's content stream and font are only stored once.
+            watermark_forms = {}
+            # Content streams that place the watermark, keyed by (resource name, trim box, rotation).
+            # Pages with the same geometry append the same indirect stream rather
+            # than each getting a freshly computed placement.
+            placement_streams = {}
+            # Shared "q" stream that saves the graphics state before the page's own content
+            push_stream = pdf.make_stream(b'q\n')
 
-        # Open the original PDF and the watermark PDF
-        reader = PdfReader(input_pdf_path)
-        watermark_reader = PdfReader(temp_watermark_pdf_path)
-        watermark_page = watermark_reader.pages[0] # Get the first page of the watermark PDF
+            # Iterate through each page of the original PDF and overlay the watermark
+            for page in pdf.pages:
+                page = pikepdf.Page(page)
+                # Rectangle converts the box to floats once, in QPDF
+                box = pikepdf.Rectangle(page.trimbox)
+                # Render at the size the page is displayed at; QPDF rotates the
+                # form into place, so an unrotated one would be scaled down
+                page_rotation = _page_rotation(page)
+                if page_rotation in (90, 270):
+                    pagesize = (box.height, box.width)
+                else:
+                    pagesize = (box.width, box.height)
+                cached = watermark_forms.get(pagesize)
+                if cached is None:
+                    watermark_pdf = stack.enter_context(pikepdf.open(io.BytesIO(
+                        render_watermark_pdf(watermark_text, font_size, opacity, rotation, pagesize))))
+                    watermark_form = pdf.copy_foreign(
+                        pikepdf.Page(watermark_pdf.pages[0]).as_form_xobject())
+                    # The size makes the name readable; the index keeps sizes that
+                    # round to the same digits apart
+                    xobject_name = pikepdf.Name(f"{WATERMARK_XOBJECT_PREFIX}_{pagesize[0]:g}x{pagesize[1]:g}"
+                                                f"_{len(watermark_forms)}")
+                    cached = watermark_forms[pagesize] = (watermark_form, xobject_name)
+                watermark_form, xobject_name = cached
 
-        writer = PdfWriter()
+                key = (xobject_name, box.llx, box.lly, box.urx, box.ury, page_rotation)
+                placement_stream = placement_streams.get(key)
+                if placement_stream is None:
+                    placement = page.calc_form_xobject_placement(
+                        watermark_form, xobject_name, box,
+                        allow_shrink=True, allow_expand=True)
+                    # Restore the page's graphics state before drawing the watermark
+                    placement_stream = pdf.make_stream(b'Q\n' + placement)
+                    placement_streams[key] = placement_stream
 
-        # Iterate through each page of the original PDF and overlay the watermark
-        for i in range(len(reader.pages)):
-            page = reader.pages[i]
-            # Merge the watermark page onto the current page
-            page.merge_page(watermark_page)
-            writer.add_page(page)
-        
-        # Save the modified PDF
-        with open(output_pdf_path, "wb") as output_file:
-            writer.write(output_file)
+                # Overlay the shared watermark onto the current page
+                page.add_resource(watermark_form, pikepdf.Name.XObject, xobject_name)
+                page.contents_add(push_stream, prepend=True)
+                page.contents_add(placement_stream)
+
+            # Save the modified PDF, passing existing streams through without decoding them.
+            # Object streams and linearization shrink the output and let viewers
+            # show the first page before the download finishes.
+            pdf.save(output_pdf_path,
+                     stream_decode_level=pikepdf.StreamDecodeLevel.none,
+                     object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                     compress_streams=True,
+                     linearize=True)
         
         print(f"Watermark added successfully to {output_pdf_path}")
         return True
@@ -76,10 +152,6 @@ def add_watermark_to_pdf(input_pdf_path, output_pdf_path):
     except Exception as e:
         print(f"Error adding watermark: {e}", file=sys.stderr)
         return False
-    finally:
-        # Clean up the temporary watermark PDF
-        if os.path.exists(temp_watermark_pdf_path):
-            os.remove(temp_watermark_pdf_path)
 
 if __name__ == "__main__":
     if len(sys.argv) != 3: # Expecting only input_pdf_path and output_pdf_path
@@ -1,7 +1,7 @@
 # scripts/convert_pdf_to_docx.py
 
 import sys
-import os
+from pathlib import Path
 from pdf2docx import Converter
 
 def main():
@@ -11,19 +11,25 @@ def main():
     
     input_pdf_path = sys.argv[1]
     output_docx_path = sys.argv[2]
-    convert_pdf_to_docx(input_pdf_path, output_docx_path)
+    if convert_pdf_to_docx(input_pdf_path, output_docx_path):
+        sys.exit(0) # Indicate success
+    else:
+        sys.exit(1) # Indicate failure
 
 def convert_pdf_to_docx(input_pdf_path, output_docx_path):
     """
     Converts a PDF file to a DOCX file using the pdf2docx Python library.
+    Returns True on success and False on failure.
     """
-    if not os.path.exists(input_pdf_path):
+    input_path = Path(input_pdf_path)
+    output_path = Path(output_docx_path)
+
+    if not input_path.exists():
         print(f"Error: Input PDF file not found at {input_pdf_path}", file=sys.stderr)
-        sys.exit(1)
+        return False
 
-    output_dir = os.path.dirname(output_docx_path)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    # A single mkdir call replaces the separate exists check
+    output_path.parent.mkdir(parents=True, exist_ok=True)
 
     try:
         print(f"Converting {input_pdf_path} to {output_docx_path} using pdf2docx...")
@@ -37,15 +43,15 @@ def convert_pdf_to_docx(input_pdf_path, output_docx_path):
         # Close the converter
         cv.close()
 
-        if not os.path.exists(output_docx_path):
+        if not output_path.exists():
             raise FileNotFoundError(f"pdf2docx did not produce the expected output file: {output_docx_path}")
         
         print(f"Successfully converted {input_pdf_path} to {output_docx_path}")
-        sys.exit(0) # Indicate success
+        return True
 
     except Exception as e:
         print(f"pdf2docx conversion failed: {e}", file=sys.stderr)
-        sys.exit(1) # Indicate failure
+        return False
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,33 @@
+# scripts/docsmart_pdf.py
+"""
+Importable entry point for the DocSmart PDF helpers.
+
+Each helper is also a standalone CLI script. Importing them from here lets a
+long-lived Python process run many operations while paying the pikepdf and
+ReportLab import cost once, and keeps module-level caches (such as the
+rendered watermark overlays) alive between operations.
+The modules are imported by their bare names, so scripts/ itself must be on
+sys.path, as it is for a script that lives in scripts/; other callers add it
+to sys.path or PYTHONPATH first.
+The file-to-file helpers return True on success and False on failure.
+repair_pdf_result, repair_pdf_bytes and repair_many return structured results,
+repaired bytes and a list of per-file results in input order respectively.
+"""
+
+from add_page_numbers import add_page_numbers
+from add_watermark import add_watermark_to_pdf
+from convert_pdf_to_docx import convert_pdf_to_docx
+from protect_pdf import protect_pdf, unlock_pdf
+from repair_pdf_pikepdf import repair_pdf, repair_pdf_result, repair_pdf_bytes, repair_many
+
+__all__ = [
+    "add_page_numbers",
+    "add_watermark_to_pdf",
+    "convert_pdf_to_docx",
+    "protect_pdf",
+    "unlock_pdf",
+    "repair_pdf",
+    "repair_pdf_result",
+    "repair_pdf_bytes",
+    "repair_many",
+]
@@ -4,37 +4,41 @@ from pikepdf import Pdf, Encryption
 def protect_pdf(input_path, output_path, password):
     """
     Protects a PDF file with a user password using AES-256 encryption.
+    Returns True on success and False on failure.
     """
     try:
-        pdf = Pdf.open(input_path)
-        # Set user and owner passwords, and specify AES-256 encryption (R=6)
-        # Permissions are set to default, which means no permissions unless specified.
-        # For full restriction, you might explicitly set permissions=pikepdf.Permissions.none
-        pdf.save(output_path,
-                 encryption=Encryption(
-                     user=password,
-                     owner=password, # Using same password for owner for simplicity
-                     R=6 # AES-256 encryption (R=6 is the highest strength in pikepdf)
-                 ))
+        with Pdf.open(input_path) as pdf:
+            # Set user and owner passwords, and specify AES-256 encryption (R=6)
+            # Permissions are set to default, which means no permissions unless specified.
+            # For full restriction, you might explicitly set permissions=pikepdf.Permissions.none
+            pdf.save(output_path,
+                     encryption=Encryption(
+                         user=password,
+                         owner=password, # Using same password for owner for simplicity
+                         R=6 # AES-256 encryption (R=6 is the highest strength in pikepdf)
+                     ))
         print(f"PDF protected successfully: {output_path}")
+        return True
     except Exception as e:
         print(f"Error protecting PDF: {e}", file=sys.stderr)
-        sys.exit(1)
+        return False
 
 def unlock_pdf(input_path, output_path, password):
     """
     Unlocks a password-protected PDF file.
+    Returns True on success and False on failure.
     """
     try:
         # Open with user password
         # pikepdf will attempt to decrypt using the provided password
-        pdf = Pdf.open(input_path, password=password)
-        # Save without encryption (effectively removing the password)
-        pdf.save(output_path)
+        with Pdf.open(input_path, password=password) as pdf:
+            # Save without encryption (effectively removing the password)
+            pdf.save(output_path)
         print(f"PDF unlocked successfully: {output_path}")
+        return True
     except Exception as e:
         print(f"Error unlocking PDF: {e}", file=sys.stderr)
-        sys.exit(1)
+        return False
 
 if __name__ == "__main__":
     # Expected arguments: action (protect/unlock), input_path, output_path, password
@@ -48,10 +52,12 @@ if __name__ == "__main__":
     password = sys.argv[4]
 
     if action == "protect":
-        protect_pdf(input_path, output_path, password)
+        success = protect_pdf(input_path, output_path, password)
     elif action == "unlock":
-        unlock_pdf(input_path, output_path, password)
+        success = unlock_pdf(input_path, output_path, password)
     else:
         print(f"Unknown action: {action}", file=sys.stderr)
         sys.exit(1)
 
+    sys.exit(0 if success else 1)
+
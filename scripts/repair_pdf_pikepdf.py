@@ -1,32 +1,502 @@
 # src/scripts/repair_pdf_pikepdf.py
 
+import argparse
+import io
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
 import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
 import pikepdf
 
-def repair_pdf(input_path, output_path):
+logger = logging.getLogger(__name__)
+
+# Buffer size for writing and copying PDFs; large buffers cut the number of
+# write() syscalls on big scanned documents. Repair inputs are memory-mapped
+# by QPDF, which reads them through page faults rather than read() calls, so
+# no read buffer or fadvise hint applies to them.
+IO_BUFFER_SIZE = 1024 * 1024
+
+# Output path that sends the repaired PDF to stdout instead of a file
+STDOUT_PATH = '-'
+
+# How far from the end of the file to look for the final startxref keyword
+STARTXREF_SEARCH_WINDOW = 1024
+
+# Files smaller than this whose cross-reference table, objects and stream
+# lengths check out are published without being parsed by QPDF. Larger files
+# always get the full parse, because scanning them in Python would cost more
+# than it saves.
+SCAN_ONLY_MAX_SIZE = 100 * 1024
+
+_STARTXREF_RE = re.compile(rb'startxref\s+(\d+)\s+%%EOF')
+_XREF_KEYWORD_RE = re.compile(rb'xref[ \t]*(?:\r\n|\r|\n)')
+_XREF_SUBSECTION_RE = re.compile(rb'(\d+)[ \t]+(\d+)[ \t]*(?:\r\n|\r|\n)')
+_XREF_ENTRY_RE = re.compile(rb'(\d{10}) (\d{5}) ([nf])\s{1,2}')
+_TRAILER_RE = re.compile(rb'\s*trailer\s*<<')
+_PREV_RE = re.compile(rb'/Prev\s+(\d+)')
+_SIZE_RE = re.compile(rb'/Size\s+(\d+)')
+_OBJ_HEADER_RE = re.compile(rb'(\d+)\s+(\d+)\s+obj\b')
+_STREAM_OR_ENDOBJ_RE = re.compile(rb'endobj|>>\s*stream(?:\r\n|\n)')
+_LENGTH_RE = re.compile(rb'/Length\s+(\d+)(?:\s+(\d+)\s+R\b)?')
+_INTEGER_OBJECT_RE = re.compile(rb'(\d+)\s+\d+\s+obj\s*(\d+)\s*endobj')
+_ENDSTREAM_RE = re.compile(rb'\s*endstream\s*endobj')
+_FILTER_RE = re.compile(rb'/Filter\s*(/[^\s/\[\]<>()]+|\[[^\]]*\])')
+_NAME_RE = re.compile(rb'/[^\s/\[\]<>()]+')
+
+# Filters that saving with StreamDecodeLevel.generalized decodes. Streams using
+# any other filter (DCT, JPX, JBIG2, CCITT) are copied through without being read.
+_GENERALIZED_FILTERS = {
+    '/FlateDecode', '/Fl', '/LZWDecode', '/LZW', '/ASCII85Decode', '/A85',
+    '/ASCIIHexDecode', '/AHx', '/RunLengthDecode', '/RL',
+}
+
+def _flate_data_ok(data):
+    """
+    Returns True when Flate-compressed data inflates without errors. The output
+    is produced and discarded IO_BUFFER_SIZE bytes at a time, so a large image
+    never has to fit in memory decoded.
+    """
+    decompressor = zlib.decompressobj()
     try:
+        while data:
+            decompressor.decompress(data, IO_BUFFER_SIZE)
+            data = decompressor.unconsumed_tail
+    except zlib.error:
+        return False
+    return True
+
+def _read_xref_table(data, offset):
+    """
+    Parses the classic xref table at offset. Returns ({object number: (generation,
+    offset)} for its in-use entries, trailer dictionary bytes), or None when there
+    is no well-formed table there (including xref streams, which are not handled).
+    """
+    match = _XREF_KEYWORD_RE.match(data, offset)
+    if match is None:
+        return None
+    position = match.end()
+    entries = {}
+    while (subsection := _XREF_SUBSECTION_RE.match(data, position)) is not None:
+        position = subsection.end()
+        first, count = int(subsection.group(1)), int(subsection.group(2))
+        for number in range(first, first + count):
+            entry = _XREF_ENTRY_RE.match(data, position)
+            if entry is None:
+                return None
+            position = entry.end()
+            if entry.group(3) == b'n':
+                entries[number] = (int(entry.group(2)), int(entry.group(1)))
+    trailer = _TRAILER_RE.match(data, position)
+    if trailer is None:
+        return None
+    end = data.find(b'startxref', trailer.end())
+    if end == -1:
+        return None
+    return entries, data[trailer.end():end]
+
+def _scanned_object_ok(data, position, objects):
+    """
+    Checks the body of the object whose "N G obj" header ends at position.
+    Other objects must not start before its endobj. For a stream, /Length
+    (direct, or an indirect integer) must end exactly at endstream, and plain
+    Flate data must inflate. Streams with other filter chains that saving would
+    decode are left to the full parse.
+    """
+    body = _STREAM_OR_ENDOBJ_RE.search(data, position)
+    if body is None or _OBJ_HEADER_RE.search(data, position, body.start()) is not None:
+        return False
+    if body.group() == b'endobj':
+        return True
+
+    dictionary = data[position:body.start() + 2]
+    length = _LENGTH_RE.search(dictionary)
+    if length is None:
+        return False
+    if length.group(2) is None:
+        stream_length = int(length.group(1))
+    else:
+        number = int(length.group(1))
+        entry = objects.get(number)
+        target = _INTEGER_OBJECT_RE.match(data, entry[1]) if entry is not None else None
+        if target is None or int(target.group(1)) != number:
+            return False
+        stream_length = int(target.group(2))
+    start = body.end()
+    end = start + stream_length
+    if end > len(data) or _ENDSTREAM_RE.match(data, end) is None:
+        return False
+
+    filters = _FILTER_RE.search(dictionary)
+    if filters is None:
+        return True
+    names = [name.decode() for name in _NAME_RE.findall(filters.group(1))]
+    if any(name not in _GENERALIZED_FILTERS for name in names):
+        return True
+    if names in (['/FlateDecode'], ['/Fl']) and b'/DecodeParms' not in dictionary:
+        return _flate_data_ok(data[start:end])
+    return False
+
+def _has_valid_header_and_xref(data):
+    """
+    Checks the structure of a PDF held in a bytes-like object (bytes or mmap)
+    without QPDF: it must start with a %PDF- header and end with a
+    startxref/%%EOF trailer. Every xref table, following /Prev through earlier
+    revisions, must parse, every in-use entry must point at the matching
+    "N G obj" header, and the newest trailer's /Size must be one more than the
+    highest object number, as QPDF warns otherwise. Each object's body is then
+    checked with _scanned_object_ok. Anything this does not handle, such as xref streams or
+    encryption, fails the check so the caller falls back to the full parse.
+    """
+    if data[:5] != b'%PDF-':
+        return False
+    position = data.rfind(b'startxref', max(0, len(data) - STARTXREF_SEARCH_WINDOW))
+    if position == -1:
+        return False
+    match = _STARTXREF_RE.match(data[position:position + 64])
+    if match is None:
+        return False
+    offset = int(match.group(1))
+
+    # Newest revision first, so its entries take precedence over older ones
+    objects = {}
+    size = None
+    visited = set()
+    while True:
+        if offset >= position or offset in visited:
+            return False
+        visited.add(offset)
+        table = _read_xref_table(data, offset)
+        if table is None:
+            return False
+        entries, trailer = table
+        if b'/XRefStm' in trailer or b'/Encrypt' in trailer:
+            return False
+        if size is None:
+            size = _SIZE_RE.search(trailer)
+        for number, entry in entries.items():
+            objects.setdefault(number, entry)
+        prev = _PREV_RE.search(trailer)
+        if prev is None:
+            break
+        offset = int(prev.group(1))
+
+    if not objects or size is None or int(size.group(1)) != max(objects) + 1:
+        return False
+    for number, (generation, object_offset) in objects.items():
+        header = _OBJ_HEADER_RE.match(data, object_offset)
+        if (header is None or int(header.group(1)) != number
+                or int(header.group(2)) != generation
+                or not _scanned_object_ok(data, header.end(), objects)):
+            return False
+    return True
+
+def _file_has_valid_header_and_xref(path):
+    """Runs _has_valid_header_and_xref on a file through a read-only memory map."""
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _has_valid_header_and_xref(mm)
+    except (OSError, ValueError):
+        # ValueError: empty files cannot be memory-mapped
+        return False
+
+def _stream_reads_cleanly(stream):
+    """Returns True when a stream's data decodes the way saving would decode it."""
+    filters = stream.get('/Filter')
+    if filters is None:
+        return True
+    filters = [str(f) for f in (filters if isinstance(filters, pikepdf.Array) else [filters])]
+    if any(f not in _GENERALIZED_FILTERS for f in filters):
+        return True
+    # Plain Flate, by far the most common case, is checked without keeping the
+    # decoded data; other chains (predictors, ASCII85 and the like) go through QPDF
+    if filters in (['/FlateDecode'], ['/Fl']) and '/DecodeParms' not in stream:
+        return _flate_data_ok(stream.read_raw_bytes())
+    try:
+        stream.read_bytes()
+    except pikepdf.PdfError:
+        return False
+    return True
+
+def _parsed_cleanly(pdf):
+    """
+    Returns True when QPDF read every object and decoded every stream that
+    saving would decode without having to recover anything.
+    """
+    if pdf.is_encrypted:
+        return False
+    # QPDF only notices a damaged object (such as a wrong stream /Length) when it
+    # parses it, so resolve every object first. Structural damage, the usual
+    # reason for a repair, is then caught before any stream is decoded.
+    streams = [obj for obj in pdf.objects if isinstance(obj, pikepdf.Stream)]
+    if pdf.get_warnings():
+        return False
+    # Damaged stream data only shows up when it is decoded. Stop at the first
+    # bad stream, so a file that needs saving is not decoded in full twice.
+    for stream in streams:
+        if not _stream_reads_cleanly(stream) or pdf.get_warnings():
+            return False
+    return True
+
+def _needs_no_repair(pdf, linearize, recompress_flate):
+    """Returns True when the original bytes can be published instead of a re-serialized copy."""
+    # Recompressing rewrites the Flate streams, so the original bytes never satisfy it.
+    # Check the options first, since _parsed_cleanly reads the whole file.
+    if recompress_flate or (linearize and not pdf.is_linearized):
+        return False
+    return _parsed_cleanly(pdf)
+
+def _save_options(linearize, object_streams, recompress_flate):
+    """Returns the Pdf.save keyword arguments shared by the path and bytes variants."""
+    return {
+        "linearize": linearize,
+        "compress_streams": True,
+        "object_stream_mode": (pikepdf.ObjectStreamMode.generate if object_streams
+                               else pikepdf.ObjectStreamMode.preserve),
+        "stream_decode_level": pikepdf.StreamDecodeLevel.generalized,
+        "recompress_flate": recompress_flate,
+    }
+
+def _open_output(path):
+    """Opens the repair output for writing; STDOUT_PATH writes to stdout without closing it."""
+    if path == STDOUT_PATH:
+        return nullcontext(sys.stdout.buffer)
+    return open(path, 'wb', buffering=IO_BUFFER_SIZE)
+
+def _link_or_copy(input_path, output_path):
+    """Publishes the input unchanged, hard-linking it when possible."""
+    if output_path == STDOUT_PATH:
+        with open(input_path, 'rb') as input_file:
+            shutil.copyfileobj(input_file, sys.stdout.buffer, IO_BUFFER_SIZE)
+        sys.stdout.buffer.flush()
+        return
+    try:
+        os.link(input_path, output_path)
+    except OSError:
+        shutil.copyfile(input_path, output_path)
+
+@contextmanager
+def _published(output_path):
+    """
+    Yields the path a repair should write to and atomically renames it over
+    output_path once the block succeeds, so readers never see a half-written PDF.
+    The temporary file never outlives the block. STDOUT_PATH is yielded as is.
+    """
+    if output_path == STDOUT_PATH:
+        yield output_path
+        return
+    temp_path = '%s.tmp.%d' % (output_path, os.getpid())
+    try:
+        yield temp_path
+        os.replace(temp_path, output_path)
+    finally:
+        # Normally renamed away already; it is left behind when the block fails,
+        # or when rename is a no-op because both paths link to the same file
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+def _result(ok, error_class, message):
+    """Builds the structured result reported for a single repair."""
+    return {"ok": ok, "error_class": error_class, "message": message}
+
+def _failure(error_class, message):
+    """
+    Logs a failed repair and builds its result. Must be called from an except
+    block; the traceback is only formatted when debug logging is enabled.
+    """
+    logger.warning("%s", message, exc_info=logger.isEnabledFor(logging.DEBUG))
+    return _result(False, error_class, message)
+
+def repair_pdf_result(input_path, output_path, linearize=False, object_streams=True, recompress_flate=False):
+    """
+    Repairs a PDF by re-serializing it with pikepdf. PDFs under
+    SCAN_ONLY_MAX_SIZE that pass _has_valid_header_and_xref, and PDFs whose
+    objects and streams all read without warnings, are copied to output_path
+    unchanged, unless recompress_flate is requested, or linearize is requested
+    and the input is not already linearized.
+
+    linearize costs extra CPU on save but lets viewers display the first page
+    before the whole file has downloaded. object_streams packs objects into
+    compressed object streams, which makes metadata-heavy PDFs noticeably smaller.
+    recompress_flate decompresses and recompresses every Flate stream at the
+    highest level; it is CPU-heavy but shrinks poorly compressed files for archiving.
+
+    Returns a dict {"ok": bool, "error_class": str or None, "message": str}.
+    error_class is "password", "not_found", "pdf" or "unexpected", so callers can
+    skip retrying files that can never be repaired without parsing the message.
+    """
+    try:
+        # A small PDF whose xref table, objects and stream lengths check out is
+        # published as is, without paying for a full parse. Linearizing and
+        # recompressing always need one.
+        if (not linearize and not recompress_flate and os.path.getsize(input_path) < SCAN_ONLY_MAX_SIZE
+                and _file_has_valid_header_and_xref(input_path)):
+            with _published(output_path) as publish_path:
+                _link_or_copy(input_path, publish_path)
+            return _result(True, None, f"PDF needed no repair, copied to: {output_path}")
+
         # Open the PDF. pikepdf's open/save process inherently repairs many corruptions.
         # It attempts to fix issues it encounters during parsing.
-        pdf = pikepdf.open(input_path)
-        
-        # Save the PDF to a new file. This re-serializes the PDF,
-        # often resolving structural issues.
-        pdf.save(output_path)
+        # The with-block closes the PDF right after saving, so libqpdf frees the
+        # object graph now rather than during interpreter shutdown.
+        # The input is memory-mapped, so libqpdf reads straight from the page
+        # cache instead of copying the file through Python read() buffers; the
+        # kernel's readahead for mapped files takes care of prefetching.
+        with pikepdf.open(input_path, access_mode=pikepdf.AccessMode.mmap) as pdf:
+
+            # A PDF that reads without warnings has nothing to repair, so skip
+            # re-serializing it and publish the original bytes instead.
+            if _needs_no_repair(pdf, linearize, recompress_flate):
+                with _published(output_path) as publish_path:
+                    _link_or_copy(input_path, publish_path)
+                return _result(True, None, f"PDF needed no repair, copied to: {output_path}")
+            
+            # Save the PDF to a new file. This re-serializes the PDF,
+            # often resolving structural issues.
+            # The file only appears under output_path once it is complete.
+            with _published(output_path) as publish_path, \
+                    _open_output(publish_path) as output_file:
+                pdf.save(output_file, **_save_options(linearize, object_streams, recompress_flate))
+                output_file.flush()
         
-        print(f"PDF successfully repaired and saved to: {output_path}")
-        sys.exit(0) # Indicate success
+        return _result(True, None, f"PDF successfully repaired and saved to: {output_path}")
+    except pikepdf.PasswordError as e:
+        return _failure("password", f"PDF is password protected: {e}")
+    except FileNotFoundError as e:
+        return _failure("not_found", f"Input PDF not found: {e}")
     except pikepdf.PdfError as e:
-        print(f"Error repairing PDF with pikepdf: {e}", file=sys.stderr)
-        sys.exit(1) # Indicate failure due to pikepdf error
+        return _failure("pdf", f"Error repairing PDF with pikepdf: {e}")
     except Exception as e:
-        print(f"An unexpected error occurred: {e}", file=sys.stderr)
-        sys.exit(1) # Indicate general failure
+        return _failure("unexpected", f"An unexpected error occurred: {e}")
+
+def repair_pdf(input_path, output_path, linearize=False, object_streams=True, recompress_flate=False):
+    """
+    Repairs a PDF; see repair_pdf_result for what the options do.
+    Failures are logged by repair_pdf_result.
+    Returns True on success and False on failure.
+    """
+    result = repair_pdf_result(input_path, output_path, linearize=linearize,
+                               object_streams=object_streams, recompress_flate=recompress_flate)
+    if result["ok"]:
+        logger.info("%s", result["message"])
+    return result["ok"]
+
+def repair_pdf_bytes(data, linearize=False, object_streams=True, recompress_flate=False):
+    """
+    Repairs a PDF held in memory and returns the repaired bytes, so callers that
+    already have the file contents avoid writing and re-reading temporary files.
+    Takes the same options as repair_pdf; PDFs that need no repair are returned as is.
+    Raises pikepdf.PdfError if the PDF cannot be repaired.
+    """
+    if (not linearize and not recompress_flate and len(data) < SCAN_ONLY_MAX_SIZE
+            and _has_valid_header_and_xref(data)):
+        return data
+
+    with pikepdf.open(io.BytesIO(data)) as pdf:
+        if _needs_no_repair(pdf, linearize, recompress_flate):
+            return data
+
+        output = io.BytesIO()
+        pdf.save(output, **_save_options(linearize, object_streams, recompress_flate))
+    return output.getvalue()
+
+def _repair_one(pair, **save_options):
+    """Repairs a single (input_path, output_path) pair; used as the pool task."""
+    input_path, output_path = pair
+    return pair, repair_pdf_result(input_path, output_path, **save_options)
+
+def repair_many(pairs, workers=None, **save_options):
+    """
+    Repairs several PDFs in parallel, using one worker process per CPU by default.
+    Processes are used rather than threads because parsing is CPU-bound C++ work.
+    save_options are passed on to repair_pdf_result.
+    Returns a list of ((input_path, output_path), result dict) tuples in input
+    order, with one entry per pair even when the same pair is given twice.
+    """
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        return list(executor.map(partial(_repair_one, **save_options), pairs, chunksize=4))
+
+def serve(**save_options):
+    """
+    Runs as a long-lived worker so pikepdf and libqpdf are only loaded once.
+    Reads one JSON request per line from stdin, {"input": ..., "output": ...},
+    repairs it and answers with the JSON result from repair_pdf_result on one
+    line of stdout. save_options are passed on to repair_pdf_result.
+    """
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if request["output"] == STDOUT_PATH:
+                raise ValueError("stdout carries the worker's responses and cannot be an output")
+            result = repair_pdf_result(request["input"], request["output"], **save_options)
+        except (ValueError, KeyError, TypeError) as e:
+            result = _failure("request", f"Invalid repair request: {e}")
+        print(json.dumps(result), flush=True)
 
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print("Usage: python repair_pdf_pikepdf.py <input_pdf_path> <output_pdf_path>", file=sys.stderr)
-        sys.exit(1)
-    
-    input_pdf_path = sys.argv[1]
-    output_pdf_path = sys.argv[2]
-    repair_pdf(input_pdf_path, output_pdf_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(
+        description="Repair PDFs with pikepdf. Prints one JSON result per input "
+                    "({\"ok\", \"error_class\", \"message\"}) and exits 0 once all inputs are processed.")
+    parser.add_argument("paths", nargs="*", metavar="PATH",
+                        help="<input_pdf_path> <output_pdf_path> pairs; an output of '-' writes "
+                             "the PDF to stdout and the JSON result to stderr")
+    parser.add_argument("--serve", action="store_true",
+                        help="run as a persistent worker reading JSON requests from stdin")
+    parser.add_argument("--linearize", action="store_true",
+                        help="linearize the output (slower to save, allows partial downloads)")
+    parser.add_argument("--no-object-streams", dest="object_streams", action="store_false",
+                        help="keep the input's object stream layout instead of generating object streams")
+    parser.add_argument("--recompress-flate", action="store_true",
+                        help="recompress Flate streams for a smaller output (CPU-heavy)")
+    args = parser.parse_args()
+
+    # Logs go to stderr. Set REPAIR_LOG=DEBUG to include full tracebacks for failures.
+    # An unknown level falls back to WARNING rather than stopping the worker.
+    log_level = (os.environ.get("REPAIR_LOG") or "WARNING").upper()
+    known_level = isinstance(logging.getLevelName(log_level), int)
+    logging.basicConfig(level=log_level if known_level else logging.WARNING,
+                        format="%(levelname)s %(name)s: %(message)s")
+    if not known_level:
+        logger.warning("Unknown REPAIR_LOG level %r, using WARNING", log_level)
+
+    save_options = {
+        "linearize": args.linearize,
+        "object_streams": args.object_streams,
+        "recompress_flate": args.recompress_flate,
+    }
+
+    if args.serve:
+        if args.paths:
+            parser.error("--serve reads its requests from stdin and takes no paths")
+        serve(**save_options)
+        sys.exit(0)
+
+    if not args.paths or len(args.paths) % 2 != 0:
+        parser.error("paths must be given as <input_pdf_path> <output_pdf_path> pairs")
+
+    pairs = list(zip(args.paths[0::2], args.paths[1::2]))
+    to_stdout = any(output_pdf_path == STDOUT_PATH for _, output_pdf_path in pairs)
+    if to_stdout and len(pairs) > 1:
+        parser.error("'-' can only be used as the output when repairing a single PDF")
+
+    if len(pairs) == 1:
+        results = [(pairs[0], repair_pdf_result(*pairs[0], **save_options))]
+    else:
+        results = repair_many(pairs, **save_options)
+
+    # Failures are reported in the JSON payload rather than the exit code,
+    # so callers can read error_class instead of parsing stderr
+    for (input_pdf_path, output_pdf_path), result in results:
+        print(json.dumps({"input": input_pdf_path, "output": output_pdf_path, **result}),
+              file=sys.stderr if to_stdout else sys.stdout)
+    sys.exit(0)
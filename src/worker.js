@@ -92,6 +92,74 @@ async function processPdfToWordWithPython(file) {
 }
 
 
+// --- Persistent PDF repair worker ---
+// A single long-lived Python process handles every repair job, so pikepdf and
+// libqpdf are imported once per worker instead of once per job.
+let repairWorker = null;
+
+function getRepairWorker() {
+  if (repairWorker) {
+    return repairWorker;
+  }
+
+  const pythonScriptPath = path.join(process.cwd(), 'scripts', 'repair_pdf_pikepdf.py');
+  // -OO skips asserts and docstrings, so the worker starts and imports a little faster
+  const pythonProcess = spawn('python3', ['-OO', pythonScriptPath, '--serve']);
+  const worker = { pythonProcess, pending: [], stdoutBuffer: '' };
+
+  // Each request is answered with one JSON result line on stdout, in request order
+  pythonProcess.stdout.on('data', (data) => {
+    worker.stdoutBuffer += data.toString();
+    let newlineIndex;
+    while ((newlineIndex = worker.stdoutBuffer.indexOf('\n')) !== -1) {
+      const line = worker.stdoutBuffer.slice(0, newlineIndex).trim();
+      worker.stdoutBuffer = worker.stdoutBuffer.slice(newlineIndex + 1);
+      const request = worker.pending.shift();
+      if (request) {
+        request.resolve(line);
+      }
+    }
+  });
+
+  pythonProcess.stderr.on('data', (data) => {
+    console.error(`Python stderr (pikepdf): ${data}`);
+  });
+
+  // If the worker dies, fail its outstanding requests; the next job starts a new one
+  const failPending = (err) => {
+    if (repairWorker === worker) {
+      repairWorker = null;
+    }
+    for (const request of worker.pending.splice(0)) {
+      request.reject(err);
+    }
+  };
+
+  pythonProcess.on('error', (err) => {
+    console.error('Failed to start Python subprocess (pikepdf):', err);
+    failPending(new Error(`Failed to start Python repair process: ${err.message}. Is Python installed and in PATH?`));
+  });
+
+  pythonProcess.on('close', (code) => {
+    failPending(new Error(`PDF repair worker exited unexpectedly (code ${code}).`));
+  });
+
+  pythonProcess.stdin.on('error', (err) => {
+    failPending(new Error(`Failed to send request to PDF repair worker: ${err.message}`));
+  });
+
+  repairWorker = worker;
+  return worker;
+}
+
+function requestPdfRepair(inputPath, outputPath) {
+  const worker = getRepairWorker();
+  return new Promise((resolve, reject) => {
+    worker.pending.push({ resolve, reject });
+    worker.pythonProcess.stdin.write(`${JSON.stringify({ input: inputPath, output: outputPath })}\n`);
+  });
+}
+
 async function processRepairPdfWithPython(file) {
   const uniqueId = uuidv4();
   const outputDir = path.join(os.tmpdir(), `repair_pdf_py_output_${uniqueId}`);
@@ -100,45 +168,38 @@ async function processRepairPdfWithPython(file) {
   const outputFileName = `${path.basename(file.originalFilename, path.extname(file.originalFilename))}_repaired.pdf`;
   const outputFilePath = path.join(outputDir, outputFileName);
 
-  return new Promise((resolve, reject) => {
-    const pythonScriptPath = path.join(process.cwd(), 'scripts', 'repair_pdf_pikepdf.py');
-    const pythonProcess = spawn('python3', [
-      pythonScriptPath,
-      file.filepath,
-      outputFilePath
-    ]);
+  let response;
+  try {
+    response = await requestPdfRepair(file.filepath, outputFilePath);
+  } catch (err) {
+    await fs.rm(outputDir, { recursive: true, force: true }).catch(console.error);
+    throw err;
+  }
 
-    let stderrOutput = '';
-    pythonProcess.stderr.on('data', (data) => {
-      stderrOutput += data.toString();
-      console.error(`Python stderr (pikepdf): ${data}`);
-    });
+  let result;
+  try {
+    result = JSON.parse(response);
+  } catch (parseError) {
+    result = { ok: false, error_class: 'protocol', message: `Unexpected response from PDF repair worker: ${response}` };
+  }
 
-    pythonProcess.on('close', async (code) => {
-      if (code === 0) {
-        try {
-          const processedBuffer = await fs.readFile(outputFilePath);
-          resolve({
-            processedBuffer,
-            processedFileName: outputFileName,
-            processedMimeType: 'application/pdf',
-            outputFilePath: outputFilePath
-          });
-        } catch (readError) {
-          await fs.rm(outputDir, { recursive: true, force: true }).catch(console.error);
-          reject(new Error(`Failed to read repaired PDF file: ${readError.message}`));
-        }
-      } else {
-        await fs.rm(outputDir, { recursive: true, force: true }).catch(console.error);
-        reject(new Error(`PDF repair failed (Python script exited with code ${code}). Stderr: ${stderrOutput}`));
-      }
-    });
+  if (!result.ok) {
+    await fs.rm(outputDir, { recursive: true, force: true }).catch(console.error);
+    throw new Error(`PDF repair failed (${result.error_class}): ${result.message}`);
+  }
 
-    pythonProcess.on('error', (err) => {
-      console.error('Failed to start Python subprocess (pikepdf):', err);
-      reject(new Error(`Failed to start Python repair process: ${err.message}. Is Python installed and in PATH?`));
-    });
-  });
+  try {
+    const processedBuffer = await fs.readFile(outputFilePath);
+    return {
+      processedBuffer,
+      processedFileName: outputFileName,
+      processedMimeType: 'application/pdf',
+      outputFilePath: outputFilePath
+    };
+  } catch (readError) {
+    await fs.rm(outputDir, { recursive: true, force: true }).catch(console.error);
+    throw new Error(`Failed to read repaired PDF file: ${readError.message}`);
+  }
 }
 
 async function processPdfSecurityWithPython(action, file, password) {
@@ -0,0 +1,165 @@
+# tests/test_repair_pdf_pikepdf.py
+# Regression tests for the repair shortcuts: the scan-only path, the no-repair
+# hard link, atomic publishing, stdout output and the --serve protocol.
+# Run with: python -m pytest tests
+
+import io
+import json
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pikepdf
+import pytest
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+SCRIPT = SCRIPTS_DIR / "repair_pdf_pikepdf.py"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+import repair_pdf_pikepdf  # noqa: E402
+
+
+def _write_pdf(path, compress_streams=True):
+    """Writes a small one-page PDF with a classic xref table and no object streams."""
+    pdf = pikepdf.new()
+    pdf.add_blank_page(page_size=(612, 792))
+    pdf.pages[0].Contents = pdf.make_stream(b"BT /F1 12 Tf 72 720 Td (hello) Tj ET\n" * 20)
+    pdf.save(path, compress_streams=compress_streams,
+             object_stream_mode=pikepdf.ObjectStreamMode.disable)
+    return path
+
+
+def _reopens_cleanly(path):
+    with pikepdf.open(path) as pdf:
+        return repair_pdf_pikepdf._parsed_cleanly(pdf)
+
+
+@pytest.fixture
+def clean_pdf(tmp_path):
+    return _write_pdf(tmp_path / "clean.pdf")
+
+
+@pytest.fixture
+def shifted_pdf(tmp_path, clean_pdf):
+    """Every object offset is off by one line; startxref is fixed up to stay valid."""
+    data = clean_pdf.read_bytes()
+    header_end = data.index(b"\n") + 1
+    comment = b"%shift\n"
+    data = data[:header_end] + comment + data[header_end:]
+    startxref = list(re.finditer(rb"startxref\s+(\d+)", data))[-1]
+    data = (data[:startxref.start(1)] + str(int(startxref.group(1)) + len(comment)).encode()
+            + data[startxref.end(1):])
+    path = clean_pdf.with_name("shifted.pdf")
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture
+def bad_length_pdf(tmp_path):
+    """The content stream's /Length is wrong, padded so every offset stays valid."""
+    data = _write_pdf(tmp_path / "uncompressed.pdf", compress_streams=False).read_bytes()
+    length = re.search(rb"/Length (\d+)", data)
+    data = data[:length.start(1)] + b"5".ljust(len(length.group(1))) + data[length.end(1):]
+    path = tmp_path / "bad_length.pdf"
+    path.write_bytes(data)
+    return path
+
+
+@pytest.mark.parametrize("damaged", ["shifted_pdf", "bad_length_pdf"])
+def test_damaged_input_is_repaired(request, tmp_path, damaged):
+    input_path = request.getfixturevalue(damaged)
+    assert input_path.stat().st_size < repair_pdf_pikepdf.SCAN_ONLY_MAX_SIZE
+    assert not repair_pdf_pikepdf._file_has_valid_header_and_xref(input_path)
+
+    output_path = tmp_path / "out.pdf"
+    result = repair_pdf_pikepdf.repair_pdf_result(str(input_path), str(output_path))
+
+    assert result["ok"]
+    assert "repaired" in result["message"]
+    assert output_path.read_bytes() != input_path.read_bytes()
+    assert _reopens_cleanly(output_path)
+
+
+@pytest.mark.parametrize("damaged", ["shifted_pdf", "bad_length_pdf"])
+def test_damaged_bytes_are_repaired(request, damaged):
+    data = request.getfixturevalue(damaged).read_bytes()
+    assert repair_pdf_pikepdf.repair_pdf_bytes(data) != data
+
+
+def test_scan_accepts_clean_input(clean_pdf):
+    assert repair_pdf_pikepdf._file_has_valid_header_and_xref(clean_pdf)
+
+
+@pytest.mark.parametrize("scan_only_max_size", [repair_pdf_pikepdf.SCAN_ONLY_MAX_SIZE, 0])
+def test_clean_input_is_hard_linked(monkeypatch, tmp_path, clean_pdf, scan_only_max_size):
+    # A limit of 0 sends the file through the full parse instead of the scan
+    monkeypatch.setattr(repair_pdf_pikepdf, "SCAN_ONLY_MAX_SIZE", scan_only_max_size)
+    output_path = tmp_path / "out.pdf"
+
+    result = repair_pdf_pikepdf.repair_pdf_result(str(clean_pdf), str(output_path))
+
+    assert result["ok"]
+    assert "needed no repair" in result["message"]
+    assert output_path.stat().st_ino == clean_pdf.stat().st_ino
+
+
+def test_recompress_flate_bypasses_the_shortcuts(tmp_path):
+    input_path = _write_pdf(tmp_path / "uncompressed.pdf", compress_streams=False)
+    output_path = tmp_path / "out.pdf"
+
+    result = repair_pdf_pikepdf.repair_pdf_result(str(input_path), str(output_path),
+                                                  recompress_flate=True)
+
+    assert result["ok"]
+    assert output_path.stat().st_ino != input_path.stat().st_ino
+    assert output_path.stat().st_size < input_path.stat().st_size
+
+
+@pytest.mark.parametrize("pdf_fixture", ["clean_pdf", "shifted_pdf"])
+def test_same_input_and_output_path(request, pdf_fixture):
+    path = request.getfixturevalue(pdf_fixture)
+
+    result = repair_pdf_pikepdf.repair_pdf_result(str(path), str(path))
+
+    assert result["ok"]
+    assert _reopens_cleanly(path)
+    assert not list(path.parent.glob("*.tmp.*"))
+
+
+def test_stdout_output(shifted_pdf):
+    completed = subprocess.run([sys.executable, str(SCRIPT), str(shifted_pdf), "-"],
+                               capture_output=True, check=True)
+
+    assert completed.stdout.startswith(b"%PDF-")
+    result = json.loads(completed.stderr.decode().strip().splitlines()[-1])
+    assert result["ok"] and result["output"] == "-"
+    with pikepdf.open(io.BytesIO(completed.stdout)) as pdf:
+        assert len(pdf.pages) == 1
+
+
+def test_serve_answers_each_request_in_order(tmp_path, clean_pdf, shifted_pdf):
+    requests = [
+        {"input": str(clean_pdf), "output": str(tmp_path / "a.pdf")},
+        {"input": str(tmp_path / "missing.pdf"), "output": str(tmp_path / "b.pdf")},
+        {"input": str(shifted_pdf), "output": "-"},
+        {"input": str(shifted_pdf), "output": str(tmp_path / "c.pdf")},
+    ]
+    stdin = "".join(json.dumps(request) + "\n" for request in requests)
+
+    completed = subprocess.run([sys.executable, str(SCRIPT), "--serve"],
+                               input=stdin, capture_output=True, text=True, check=True)
+
+    results = [json.loads(line) for line in completed.stdout.splitlines()]
+    assert [result["ok"] for result in results] == [True, False, False, True]
+    assert [result["error_class"] for result in results] == [None, "not_found", "request", None]
+    assert _reopens_cleanly(tmp_path / "c.pdf")
+
+
+def test_repair_many_keeps_duplicate_pairs(tmp_path, clean_pdf):
+    pair = (str(clean_pdf), str(tmp_path / "out.pdf"))
+
+    results = repair_pdf_pikepdf.repair_many([pair, pair], workers=1)
+
+    assert [p for p, _ in results] == [pair, pair]
+    assert all(result["ok"] for _, result in results)